@@ -1,19 +1,49 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request
+from flask.json.provider import JSONProvider
 from pymongo import MongoClient
+from pymongo.errors import OperationFailure
 from bson import ObjectId
-from datetime import datetime
-import pandas as pd
-import numpy as np
 import logging
 import os
 from flask_cors import CORS
+import click
 from dotenv import load_dotenv
+from cachetools import TTLCache
+from cachetools.keys import hashkey
+import threading
+import hmac
+import functools
+import csv
+import io
+import orjson
+import time
 import sys
 
 # Load environment variables
 load_dotenv()
 
+
+class ORJSONProvider(JSONProvider):
+    """Serialize jsonify responses with orjson instead of the stdlib json module"""
+
+    # Sorted keys keep the output order of Flask's default provider, and
+    # non-string group keys (e.g. numeric categories) are stringified like json does
+    option = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, option=self.option).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        # Hand orjson's bytes straight to the response instead of round-tripping through str
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(orjson.dumps(obj, option=self.option), mimetype="application/json")
+
+
 app = Flask(__name__)
+app.json = ORJSONProvider(app)
 CORS(app)  # Enable CORS for all routes
 
 # Configure logging
@@ -30,367 +60,526 @@ DB_NAME = os.getenv("DB_NAME", "analytics_db")
 client = MongoClient(MONGO_URI)
 db = client[DB_NAME]
 
+# In-process caches for pipeline results and endpoint payloads
+DATA_CACHE_TTL = int(os.getenv("DATA_CACHE_TTL", 60))
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", 30))
+_DATA_CACHE = TTLCache(maxsize=64, ttl=DATA_CACHE_TTL)
+_RESP_CACHE = TTLCache(maxsize=256, ttl=RESPONSE_CACHE_TTL)
+MARKETS_CACHE_TTL = int(os.getenv("MARKETS_CACHE_TTL", 60))
+_MARKETS_CACHE = TTLCache(maxsize=1, ttl=MARKETS_CACHE_TTL)
+# Shared cache version in MongoDB, bumped by /api/_flush so every worker drops its entries
+VERSION_CHECK_INTERVAL = int(os.getenv("VERSION_CHECK_INTERVAL", 5))
+_VERSION_CACHE = TTLCache(maxsize=1, ttl=VERSION_CHECK_INTERVAL)
+_LAST_VERSION = 0  # last version read, served while MongoDB is unreachable
+_CACHE_LOCK = threading.RLock()  # TTLCache is not thread-safe
+_IN_FLIGHT = {}  # data cache key -> {'done': Event, 'result': (rows, error)} of the running fetch
+FLUSH_TOKEN = os.getenv("FLUSH_TOKEN")  # /api/_flush is disabled when unset
+_LAST_UPDATED = (0, "")  # (epoch second, formatted timestamp)
+
+
+@app.cli.command('create-indexes')
+def create_indexes():
+    """Create the marketId index backing the $match stage and distinct("marketId")"""
+    db.analytics.create_index("marketId")
+    click.echo("Indexes created")
+
+
+# Aggregation stages shared by the summary, chart and dashboard endpoints
+STATS_STAGES = [
+    {"$group": {
+        "_id": None,
+        "total_sales": {"$sum": "$purchaseAmount"},
+        "avg_purchase": {"$avg": "$purchaseAmount"},
+        "total_orders": {"$sum": 1}
+    }}
+]
+# Count distinct customers by grouping rather than $addToSet,
+# which would build one unbounded array of user ids
+CUSTOMER_STAGES = [
+    {"$match": {"userId": {"$ne": None}}},
+    {"$group": {"_id": "$userId"}},
+    {"$count": "unique_customers"}
+]
+CATEGORY_STAGES = [
+    {"$unwind": "$categories"},
+    {"$group": {
+        "_id": {"$ifNull": ["$categories.category", "Unknown"]},
+        "count": {"$sum": 1},
+        "sales": {"$sum": {"$ifNull": ["$categories.amount", 0]}},
+        "average": {"$avg": {"$ifNull": ["$categories.amount", 0]}}
+    }}
+]
+LOCATION_STAGES = [
+    {"$group": {"_id": "$location", "count": {"$sum": 1}, "sales": {"$sum": "$purchaseAmount"}}}
+]
+TOP_CATEGORY_STAGES = [
+    {"$unwind": "$categories"},
+    {"$group": {
+        "_id": {"location": "$location", "category": {"$ifNull": ["$categories.category", "Unknown"]}},
+        "count": {"$sum": 1}
+    }},
+    {"$sort": {"count": -1}},
+    {"$group": {"_id": "$_id.location", "category": {"$first": "$_id.category"}}}
+]
+SEASON_STAGES = [
+    {"$group": {"_id": "$season", "sales": {"$sum": "$purchaseAmount"}}}
+]
+# Parse string dates like pd.to_datetime did; unparseable values become null and
+# are dropped instead of failing the whole $facet
+DAILY_STAGES = [
+    {"$set": {"orderDate": {"$convert": {"input": "$orderDate", "to": "date", "onError": None, "onNull": None}}}},
+    {"$match": {"orderDate": {"$ne": None}}},
+    {"$group": {
+        "_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$orderDate"}},
+        "sales": {"$sum": "$purchaseAmount"}
+    }}
+]
+GENDER_STAGES = [
+    {"$group": {"_id": "$customerGender", "count": {"$sum": 1}, "sales": {"$sum": "$purchaseAmount"}}}
+]
+AGE_BINS = [0, 25, 35, 45, 55, 100]
+AGE_LABELS = ['<25', '25-34', '35-44', '45-54', '55+']
+AGE_SUMMARY_STAGES = [
+    {"$group": {
+        "_id": None,
+        "average": {"$avg": "$customerAge"},
+        "min": {"$min": "$customerAge"},
+        "max": {"$max": "$customerAge"}
+    }}
+]
+AGE_GROUP_STAGES = [
+    {"$bucket": {
+        "groupBy": "$customerAge",
+        "boundaries": AGE_BINS,
+        "default": "other",
+        "output": {"count": {"$sum": 1}}
+    }}
+]
+SEASONS_ORDER = ['Winter', 'Spring', 'Summer', 'Fall']
+
+# Sub-pipelines that can run side by side in one $facet stage
+FACETS = {
+    'totals': STATS_STAGES,
+    'customers': CUSTOMER_STAGES,
+    'categories': CATEGORY_STAGES,
+    'locations': LOCATION_STAGES,
+    'top_categories': TOP_CATEGORY_STAGES,
+    'seasons': SEASON_STAGES,
+    'days': DAILY_STAGES,
+    'genders': GENDER_STAGES,
+    'age_summary': AGE_SUMMARY_STAGES,
+    'age_groups': AGE_GROUP_STAGES
+}
+
 print(f"Python version: {sys.version}")
-def load_data(market_id=None):
-    """Load data from MongoDB and convert to DataFrame"""
+def _aggregate_data_uncached(market_id, stages):
+    """Run an aggregation pipeline on MongoDB and return the grouped rows"""
     try:
         query = {}
         if market_id:
-            try:
-                query["marketId"] = ObjectId(market_id)
-            except:
-                return pd.DataFrame(), "Invalid market ID format"
-
-        # Projection to include only needed fields
-        projection = {
-            "userId": 1,
-            "customerAge": 1,
-            "customerGender": 1,
-            "purchaseAmount": 1,
-            "location": 1,
-            "season": 1,
-            "categories": 1,
-            "orderDate": 1,
-            "_id": 0
+            query["marketId"] = ObjectId(market_id)
+
+        # The per-user $group in the customers facet can outgrow the in-memory stage limit
+        cursor = db.analytics.aggregate([{"$match": query}] + stages, allowDiskUse=True)
+        return list(cursor), None
+    except Exception as e:
+        app.logger.error(f"Error loading data: {str(e)}")
+        return [], str(e)
+
+
+def data_version():
+    """Return the shared cache version, re-read from MongoDB at most every VERSION_CHECK_INTERVAL seconds"""
+    global _LAST_VERSION
+    with _CACHE_LOCK:
+        version = _VERSION_CACHE.get('version')
+    if version is None:
+        try:
+            doc = db.cache_meta.find_one({"_id": "analytics"}) or {}
+            version = doc.get('version', 0)
+        except Exception as e:
+            # Keep serving cached payloads through an outage; retry after the interval
+            app.logger.warning(f"Could not read cache version, keeping {_LAST_VERSION}: {str(e)}")
+            version = _LAST_VERSION
+        with _CACHE_LOCK:
+            _LAST_VERSION = version
+            _VERSION_CACHE['version'] = version
+    return version
+
+
+def aggregate_data(market_id, stages, version):
+    """Run an aggregation pipeline, reusing rows fetched within DATA_CACHE_TTL"""
+    # Reject malformed ids up front instead of catching ObjectId's exception
+    if market_id and not ObjectId.is_valid(market_id):
+        return [], "Invalid market ID format"
+
+    key = hashkey(version, market_id, repr(stages))
+
+    with _CACHE_LOCK:
+        rows = _DATA_CACHE.get(key)
+        if rows is not None:
+            return rows, None
+        flight = _IN_FLIGHT.get(key)
+        leader = flight is None
+        if leader:
+            flight = _IN_FLIGHT[key] = {'done': threading.Event(), 'result': ([], "Data fetch failed")}
+
+    # Single-flight: parallel misses on one key wait for the first and share its
+    # rows or its error; only requests arriving after it finishes fetch again
+    if not leader:
+        flight['done'].wait()
+        return flight['result']
+
+    try:
+        flight['result'] = _aggregate_data_uncached(market_id, stages)
+    finally:
+        with _CACHE_LOCK:
+            rows, error = flight['result']
+            if error is None:
+                _DATA_CACHE[key] = rows
+            del _IN_FLIGHT[key]
+        flight['done'].set()
+    return flight['result']
+
+
+def dashboard_facets(market_id, version):
+    """Run every facet in one pipeline, so all endpoints share one cached scan per market"""
+    rows, error = aggregate_data(market_id, [{"$facet": FACETS}], version)
+    return (rows[0] if rows else {}), error
+
+
+def get_cached_response(endpoint, market_id, version):
+    """Return the cached payload of an endpoint for a market, if still fresh"""
+    with _CACHE_LOCK:
+        return _RESP_CACHE.get((endpoint, market_id, version))
+
+
+def cache_response(endpoint, market_id, version, payload):
+    """Store the payload of an endpoint for a market and return it"""
+    with _CACHE_LOCK:
+        _RESP_CACHE[(endpoint, market_id, version)] = payload
+    return payload
+
+
+def available_markets():
+    """Return the distinct market ids, refreshed at most every MARKETS_CACHE_TTL seconds"""
+    version = data_version()
+    with _CACHE_LOCK:
+        entry = _MARKETS_CACHE.get('markets')
+    if entry is not None and entry[0] == version:
+        return entry[1]
+
+    markets = [str(mid) for mid in db.analytics.distinct("marketId")]
+    with _CACHE_LOCK:
+        _MARKETS_CACHE['markets'] = (version, markets)
+    return markets
+
+
+def watch_markets():
+    """Drop the cached market list whenever a write may have changed it"""
+    pipeline = [{"$match": {"operationType": {"$in": ["insert", "delete"]}}}]
+    resume_token = None
+    backoff = 1
+    while True:
+        try:
+            with db.analytics.watch(pipeline, resume_after=resume_token) as stream:
+                backoff = 1
+                for change in stream:
+                    resume_token = stream.resume_token
+                    with _CACHE_LOCK:
+                        entry = _MARKETS_CACHE.get('markets')
+                        markets = entry[1] if entry else []
+                        # Inserts into a market we already list cannot change the result
+                        if (change['operationType'] == 'delete'
+                                or str(change['fullDocument'].get('marketId')) not in markets):
+                            _MARKETS_CACHE.clear()
+        except Exception as e:
+            if isinstance(e, OperationFailure):
+                # e.g. the resume point left the oplog; start a fresh stream instead
+                resume_token = None
+            app.logger.warning(f"Market change stream failed, retrying in {backoff}s: {str(e)}")
+
+        # Writes may have been missed while the stream was down
+        with _CACHE_LOCK:
+            _MARKETS_CACHE.clear()
+        time.sleep(backoff)
+        backoff = min(backoff * 2, 60)
+
+
+# Change streams need a replica set, so watching is opt-in
+if os.getenv("WATCH_MARKETS") == "1":
+    threading.Thread(target=watch_markets, daemon=True).start()
+
+
+def last_updated():
+    """Return the current local time as text, formatting it at most once per second"""
+    global _LAST_UPDATED
+    now = int(time.time())
+    if now != _LAST_UPDATED[0]:
+        _LAST_UPDATED = (now, time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(now)))
+    return _LAST_UPDATED[1]
+
+
+def group_dict(rows, field):
+    """Map each group key to one of its aggregated values, skipping null keys"""
+    return {row['_id']: row[field] for row in rows if row['_id'] is not None}
+
+
+def sorted_groups(rows, field):
+    """Sort grouped rows by an aggregated value, largest first, skipping null keys"""
+    rows = [row for row in rows if row['_id'] is not None]
+    return sorted(rows, key=lambda row: row[field], reverse=True)
+
+
+def build_stats(market_id, facets):
+    """Build the stats payload from the totals and customers facets"""
+    totals = facets['totals'][0]
+    customers = facets['customers']
+    return {
+        'total_sales': float(totals['total_sales']),
+        'avg_purchase': float(totals['avg_purchase'] or 0),
+        'total_orders': int(totals['total_orders']),
+        'unique_customers': int(customers[0]['unique_customers']) if customers else 0,
+        'last_updated': last_updated(),
+        'market_id': market_id or 'all'
+    }
+
+
+def build_categories(market_id, facets):
+    """Build the categories payload from the categories facet"""
+    rows = facets['categories']
+    return {
+        'distribution': group_dict(rows, 'count'),
+        'sales': group_dict(rows, 'sales'),
+        'average_purchase': group_dict(rows, 'average'),
+        'market_id': market_id or 'all'
+    }
+
+
+def build_locations(market_id, facets):
+    """Build the locations payload from the locations and top_categories facets"""
+    rows = facets['locations']
+    return {
+        'distribution': group_dict(rows, 'count'),
+        'sales': group_dict(rows, 'sales'),
+        'top_categories': group_dict(facets['top_categories'], 'category'),
+        'market_id': market_id or 'all'
+    }
+
+
+def build_time_analysis(market_id, facets):
+    """Build the time analysis payload from the seasons and days facets"""
+    return {
+        'season_sales': group_dict(facets['seasons'], 'sales'),
+        'daily_sales': group_dict(facets['days'], 'sales'),
+        'market_id': market_id or 'all'
+    }
+
+
+def build_demographics(market_id, facets):
+    """Build the demographics payload from the genders and age facets"""
+    rows = facets['genders']
+
+    age_stats = {}
+    summary = facets['age_summary']
+    if summary and summary[0]['average'] is not None:
+        age_stats = {
+            'average': float(summary[0]['average']),
+            'min': float(summary[0]['min']),
+            'max': float(summary[0]['max'])
         }
 
-        cursor = db.analytics.find(query, projection)
-        df = pd.DataFrame(list(cursor))
+        # Age groups
+        age_group_counts = dict.fromkeys(AGE_LABELS, 0)
+        for row in facets['age_groups']:
+            if row['_id'] in AGE_BINS:
+                age_group_counts[AGE_LABELS[AGE_BINS.index(row['_id'])]] = row['count']
+        age_stats['groups'] = age_group_counts
 
-        # Convert data types
-        if not df.empty:
-            if 'orderDate' in df:
-                df['orderDate'] = pd.to_datetime(df['orderDate'])
-            if 'purchaseAmount' in df:
-                df['purchaseAmount'] = pd.to_numeric(df['purchaseAmount'])
-            if 'customerAge' in df:
-                df['customerAge'] = pd.to_numeric(df['customerAge'])
+    return {
+        'gender_distribution': group_dict(rows, 'count'),
+        'gender_sales': group_dict(rows, 'sales'),
+        'age_stats': age_stats,
+        'market_id': market_id or 'all'
+    }
 
-        return df, None
-    except Exception as e:
-        app.logger.error(f"Error loading data: {str(e)}")
-        return pd.DataFrame(), str(e)
+
+def chart_csv(chart_data):
+    """Render a chart payload as a label,value CSV body"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(['label', 'value'])
+    writer.writerows(zip(chart_data['labels'], chart_data['values']))
+    return buffer.getvalue()
+
+
+def wants_csv():
+    """Check whether the client asked for CSV instead of JSON"""
+    return request.args.get('format') == 'csv' or request.accept_mimetypes.best == 'text/csv'
+
+
+def analytics_endpoint(name, chart=False):
+    """Wrap a view that builds its payload from the dashboard facets with caching and error handling"""
+    def decorator(build):
+        @functools.wraps(build)
+        def view():
+            try:
+                market_id = request.args.get('market_id', None)
+                version = data_version()
+                payload = get_cached_response(name, market_id, version)
+
+                if payload is None:
+                    facets, error = dashboard_facets(market_id, version)
+
+                    if not facets.get('totals'):
+                        return jsonify({"error": error or "No data found"}), 404
+
+                    payload = cache_response(name, market_id, version, build(market_id, facets))
+
+                # Chart series can be long, and CSV skips the JSON number encoding
+                if chart and wants_csv():
+                    response = Response(chart_csv(payload), mimetype='text/csv')
+                else:
+                    response = jsonify(payload)
+
+                if chart:
+                    # The body depends on Accept, so shared caches must key on it
+                    response.vary.add('Accept')
+                return response
+            except Exception as e:
+                app.logger.error(f"Error in {name} endpoint: {str(e)}")
+                return jsonify({"error": str(e)}), 500
+        return view
+    return decorator
 
 
 @app.route('/api/stats', methods=['GET'])
-def get_stats():
+@analytics_endpoint('stats')
+def get_stats(market_id, facets):
     """Get basic statistics"""
-    try:
-        market_id = request.args.get('market_id', None)
-        df, error = load_data(market_id)
-
-        if df.empty:
-            return jsonify({"error": error or "No data found"}), 404
-
-        stats = {
-            'total_sales': float(df['purchaseAmount'].sum()),
-            'avg_purchase': float(df['purchaseAmount'].mean()),
-            'total_orders': int(len(df)),
-            'unique_customers': int(df['userId'].nunique()),
-            'last_updated': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            'market_id': market_id or 'all'
-        }
-
-        return jsonify({'stats': stats})
-    except Exception as e:
-        app.logger.error(f"Error in stats endpoint: {str(e)}")
-        return jsonify({"error": str(e)}), 500
+    return {'stats': build_stats(market_id, facets)}
 
 
 @app.route('/api/categories', methods=['GET'])
-def get_categories():
+@analytics_endpoint('categories')
+def get_categories(market_id, facets):
     """Get category analytics"""
-    try:
-        market_id = request.args.get('market_id', None)
-        df, error = load_data(market_id)
-
-        if df.empty:
-            return jsonify({"error": error or "No data found"}), 404
-
-        # Explode categories array into rows
-        if 'categories' in df:
-            category_data = []
-            for _, row in df.iterrows():
-                if isinstance(row.get('categories'), list):
-                    for cat in row['categories']:
-                        if isinstance(cat, dict):
-                            category_data.append({
-                                'category': cat.get('category', 'Unknown'),
-                                'amount': float(cat.get('amount', 0))
-                            })
-
-            if category_data:
-                category_df = pd.DataFrame(category_data)
-                category_counts = category_df['category'].value_counts().to_dict()
-                category_sales = category_df.groupby('category')['amount'].sum().to_dict()
-                avg_by_category = category_df.groupby('category')['amount'].mean().to_dict()
-            else:
-                category_counts = category_sales = avg_by_category = {}
-        else:
-            category_counts = category_sales = avg_by_category = {}
-
-        return jsonify({
-            'distribution': category_counts,
-            'sales': category_sales,
-            'average_purchase': avg_by_category,
-            'market_id': market_id or 'all'
-        })
-    except Exception as e:
-        app.logger.error(f"Error in categories endpoint: {str(e)}")
-        return jsonify({"error": str(e)}), 500
+    return build_categories(market_id, facets)
 
 
 @app.route('/api/locations', methods=['GET'])
-def get_locations():
+@analytics_endpoint('locations')
+def get_locations(market_id, facets):
     """Get location analytics"""
-    try:
-        market_id = request.args.get('market_id', None)
-        df, error = load_data(market_id)
-
-        if df.empty:
-            return jsonify({"error": error or "No data found"}), 404
-
-        if 'location' in df:
-            location_counts = df['location'].value_counts().to_dict()
-            location_sales = df.groupby('location')['purchaseAmount'].sum().to_dict()
-
-            # Top category per location
-            top_categories = {}
-            for location in df['location'].unique():
-                location_df = df[df['location'] == location]
-                if not location_df.empty and 'categories' in location_df:
-                    categories = []
-                    for _, row in location_df.iterrows():
-                        if isinstance(row.get('categories'), list):
-                            for cat in row['categories']:
-                                if isinstance(cat, dict):
-                                    categories.append(cat.get('category', 'Unknown'))
-                    if categories:
-                        top_cat = pd.Series(categories).value_counts().index[0]
-                        top_categories[location] = top_cat
-        else:
-            location_counts = location_sales = top_categories = {}
-
-        return jsonify({
-            'distribution': location_counts,
-            'sales': location_sales,
-            'top_categories': top_categories,
-            'market_id': market_id or 'all'
-        })
-    except Exception as e:
-        app.logger.error(f"Error in locations endpoint: {str(e)}")
-        return jsonify({"error": str(e)}), 500
+    return build_locations(market_id, facets)
 
 
 @app.route('/api/time_analysis', methods=['GET'])
-def get_time_analysis():
+@analytics_endpoint('time_analysis')
+def get_time_analysis(market_id, facets):
     """Get time-based analytics"""
-    try:
-        market_id = request.args.get('market_id', None)
-        df, error = load_data(market_id)
-
-        if df.empty:
-            return jsonify({"error": error or "No data found"}), 404
-
-        # Season sales
-        season_sales = {}
-        if 'season' in df:
-            season_sales = df.groupby('season')['purchaseAmount'].sum().to_dict()
-
-        # Daily sales
-        daily_sales = {}
-        if 'orderDate' in df and not df['orderDate'].isnull().all():
-            daily_sales = df.groupby(df['orderDate'].dt.date.astype(str))['purchaseAmount'].sum().to_dict()
-
-        return jsonify({
-            'season_sales': season_sales,
-            'daily_sales': daily_sales,
-            'market_id': market_id or 'all'
-        })
-    except Exception as e:
-        app.logger.error(f"Error in time_analysis endpoint: {str(e)}")
-        return jsonify({"error": str(e)}), 500
+    return build_time_analysis(market_id, facets)
 
 
 @app.route('/api/demographics', methods=['GET'])
-def get_demographics():
+@analytics_endpoint('demographics')
+def get_demographics(market_id, facets):
     """Get demographic analytics"""
-    try:
-        market_id = request.args.get('market_id', None)
-        df, error = load_data(market_id)
-
-        if df.empty:
-            return jsonify({"error": error or "No data found"}), 404
-
-        # Gender analytics
-        gender_counts = gender_sales = {}
-        if 'customerGender' in df:
-            gender_counts = df['customerGender'].value_counts().to_dict()
-            gender_sales = df.groupby('customerGender')['purchaseAmount'].sum().to_dict()
-
-        # Age analytics
-        age_stats = {}
-        if 'customerAge' in df:
-            df['customerAge'] = pd.to_numeric(df['customerAge'], errors='coerce')
-            if not df['customerAge'].isnull().all():
-                age_stats = {
-                    'average': float(df['customerAge'].mean()),
-                    'min': float(df['customerAge'].min()),
-                    'max': float(df['customerAge'].max())
-                }
-
-                # Age groups
-                bins = [0, 25, 35, 45, 55, 100]
-                labels = ['<25', '25-34', '35-44', '45-54', '55+']
-                df['Age Group'] = pd.cut(df['customerAge'], bins=bins, labels=labels, right=False)
-                age_group_counts = df['Age Group'].value_counts().to_dict()
-                age_stats['groups'] = age_group_counts
+    return build_demographics(market_id, facets)
 
-        return jsonify({
-            'gender_distribution': gender_counts,
-            'gender_sales': gender_sales,
-            'age_stats': age_stats,
-            'market_id': market_id or 'all'
-        })
-    except Exception as e:
-        app.logger.error(f"Error in demographics endpoint: {str(e)}")
-        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/dashboard', methods=['GET'])
+@analytics_endpoint('dashboard')
+def get_dashboard(market_id, facets):
+    """Get every summary section from a single aggregation"""
+    return {
+        'stats': build_stats(market_id, facets),
+        'categories': build_categories(market_id, facets),
+        'locations': build_locations(market_id, facets),
+        'time_analysis': build_time_analysis(market_id, facets),
+        'demographics': build_demographics(market_id, facets),
+        'market_id': market_id or 'all'
+    }
 
 
 @app.route('/api/charts/category_sales', methods=['GET'])
-def get_category_sales_chart():
+@analytics_endpoint('category_sales', chart=True)
+def get_category_sales_chart(market_id, facets):
     """Get category sales data for charts"""
-    try:
-        market_id = request.args.get('market_id', None)
-        df, error = load_data(market_id)
-
-        if df.empty:
-            return jsonify({"error": error or "No data found"}), 404
-
-        category_sales = []
-        if 'categories' in df:
-            category_data = []
-            for _, row in df.iterrows():
-                if isinstance(row.get('categories'), list):
-                    for cat in row['categories']:
-                        if isinstance(cat, dict):
-                            category_data.append({
-                                'category': cat.get('category', 'Unknown'),
-                                'amount': float(cat.get('amount', 0))
-                            })
-
-            if category_data:
-                category_df = pd.DataFrame(category_data)
-                category_sales = category_df.groupby('category')['amount'].sum().reset_index()
-                category_sales = category_sales.sort_values('amount', ascending=False)
-
-        chart_data = {
-            'labels': category_sales['category'].tolist() if not category_sales.empty else [],
-            'values': category_sales['amount'].tolist() if not category_sales.empty else [],
-            'title': 'Sales by Category',
-            'market_id': market_id or 'all'
-        }
+    category_sales = sorted_groups(facets['categories'], 'sales')
 
-        return jsonify(chart_data)
-    except Exception as e:
-        app.logger.error(f"Error generating category sales data: {str(e)}")
-        return jsonify({"error": str(e)}), 500
+    return {
+        'labels': [row['_id'] for row in category_sales],
+        'values': [row['sales'] for row in category_sales],
+        'title': 'Sales by Category',
+        'market_id': market_id or 'all'
+    }
 
 
 @app.route('/api/charts/location_sales', methods=['GET'])
-def get_location_sales_chart():
+@analytics_endpoint('location_sales', chart=True)
+def get_location_sales_chart(market_id, facets):
     """Get location sales data for charts"""
-    try:
-        market_id = request.args.get('market_id', None)
-        df, error = load_data(market_id)
-
-        if df.empty:
-            return jsonify({"error": error or "No data found"}), 404
-
-        if 'location' in df:
-            location_sales = df.groupby('location')['purchaseAmount'].sum().reset_index()
-            location_sales = location_sales.sort_values('purchaseAmount', ascending=False)
-        else:
-            location_sales = pd.DataFrame()
-
-        chart_data = {
-            'labels': location_sales['location'].tolist() if not location_sales.empty else [],
-            'values': location_sales['purchaseAmount'].tolist() if not location_sales.empty else [],
-            'title': 'Sales by Location',
-            'market_id': market_id or 'all'
-        }
+    location_sales = sorted_groups(facets['locations'], 'sales')
 
-        return jsonify(chart_data)
-    except Exception as e:
-        app.logger.error(f"Error generating location sales data: {str(e)}")
-        return jsonify({"error": str(e)}), 500
+    return {
+        'labels': [row['_id'] for row in location_sales],
+        'values': [row['sales'] for row in location_sales],
+        'title': 'Sales by Location',
+        'market_id': market_id or 'all'
+    }
 
 
 @app.route('/api/charts/gender_distribution', methods=['GET'])
-def get_gender_distribution_chart():
+@analytics_endpoint('gender_distribution', chart=True)
+def get_gender_distribution_chart(market_id, facets):
     """Get gender distribution data for charts"""
-    try:
-        market_id = request.args.get('market_id', None)
-        df, error = load_data(market_id)
-
-        if df.empty:
-            return jsonify({"error": error or "No data found"}), 404
-
-        if 'customerGender' in df:
-            gender_counts = df['customerGender'].value_counts().reset_index()
-        else:
-            gender_counts = pd.DataFrame(columns=['customerGender', 'count'])
-
-        chart_data = {
-            'labels': gender_counts['customerGender'].tolist() if not gender_counts.empty else [],
-            'values': gender_counts['count'].tolist() if not gender_counts.empty else [],
-            'title': 'Gender Distribution',
-            'market_id': market_id or 'all'
-        }
+    gender_counts = sorted_groups(facets['genders'], 'count')
 
-        return jsonify(chart_data)
-    except Exception as e:
-        app.logger.error(f"Error generating gender distribution data: {str(e)}")
-        return jsonify({"error": str(e)}), 500
+    return {
+        'labels': [row['_id'] for row in gender_counts],
+        'values': [row['count'] for row in gender_counts],
+        'title': 'Gender Distribution',
+        'market_id': market_id or 'all'
+    }
 
 
 @app.route('/api/charts/seasonal_sales', methods=['GET'])
-def get_seasonal_sales_chart():
+@analytics_endpoint('seasonal_sales', chart=True)
+def get_seasonal_sales_chart(market_id, facets):
     """Get seasonal sales data for charts"""
-    try:
-        market_id = request.args.get('market_id', None)
-        df, error = load_data(market_id)
-
-        if df.empty:
-            return jsonify({"error": error or "No data found"}), 404
-
-        if 'season' in df:
-            seasons_order = ['Winter', 'Spring', 'Summer', 'Fall']
-            season_sales = df.groupby('season')['purchaseAmount'].sum().reset_index()
-            season_sales['season'] = pd.Categorical(season_sales['season'], categories=seasons_order, ordered=True)
-            season_sales = season_sales.sort_values('season')
-        else:
-            season_sales = pd.DataFrame()
-
-        chart_data = {
-            'labels': season_sales['season'].tolist() if not season_sales.empty else [],
-            'values': season_sales['purchaseAmount'].tolist() if not season_sales.empty else [],
-            'title': 'Sales by Season',
-            'market_id': market_id or 'all'
-        }
-
-        return jsonify(chart_data)
-    except Exception as e:
-        app.logger.error(f"Error generating seasonal sales data: {str(e)}")
-        return jsonify({"error": str(e)}), 500
+    # Known seasons in calendar order, anything else last
+    season_sales = sorted(
+        (row for row in facets['seasons'] if row['_id'] is not None),
+        key=lambda row: SEASONS_ORDER.index(row['_id']) if row['_id'] in SEASONS_ORDER else len(SEASONS_ORDER)
+    )
+
+    return {
+        'labels': [row['_id'] for row in season_sales],
+        'values': [row['sales'] for row in season_sales],
+        'title': 'Sales by Season',
+        'market_id': market_id or 'all'
+    }
+
+
+@app.route('/api/charts/daily_sales', methods=['GET'])
+@analytics_endpoint('daily_sales', chart=True)
+def get_daily_sales_chart(market_id, facets):
+    """Get daily sales data for charts"""
+    daily_sales = sorted(facets['days'], key=lambda row: row['_id'])
+
+    return {
+        'labels': [row['_id'] for row in daily_sales],
+        'values': [row['sales'] for row in daily_sales],
+        'title': 'Daily Sales',
+        'market_id': market_id or 'all'
+    }
 
 
 @app.route('/api/available_markets', methods=['GET'])
 def get_available_markets():
     """Get list of available markets"""
     try:
-        market_ids = db.analytics.distinct("marketId")
-        markets = [str(mid) for mid in market_ids]
+        markets = available_markets()
 
         return jsonify({
             'available_markets': markets,
@@ -401,6 +590,30 @@ def get_available_markets():
         return jsonify({"error": str(e)}), 500
 
 
+@app.route('/api/_flush', methods=['POST'])
+def flush_cache():
+    """Drop cached pipeline results and payloads after a write"""
+    # Internal route: callers must present the shared FLUSH_TOKEN
+    token = request.headers.get('X-Flush-Token', '')
+    if not FLUSH_TOKEN or not hmac.compare_digest(token.encode(), FLUSH_TOKEN.encode()):
+        return jsonify({"error": "Forbidden"}), 403
+
+    try:
+        # Other workers see the new version within VERSION_CHECK_INTERVAL seconds
+        db.cache_meta.update_one({"_id": "analytics"}, {"$inc": {"version": 1}}, upsert=True)
+
+        with _CACHE_LOCK:
+            _DATA_CACHE.clear()
+            _RESP_CACHE.clear()
+            _MARKETS_CACHE.clear()
+            _VERSION_CACHE.clear()
+
+        return jsonify({'flushed': True})
+    except Exception as e:
+        app.logger.error(f"Error flushing caches: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+
 if __name__ == '__main__':
     app.logger.info('Starting Flask API server for analytics')
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
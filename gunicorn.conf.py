@@ -0,0 +1,15 @@
+import os
+
+# Gunicorn configuration, picked up automatically from the working directory
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+# Bounded by default: cpu_count() reports host cores inside containers, and every
+# worker keeps its own caches and runs its own $facet scan on a miss
+workers = int(os.getenv("WEB_CONCURRENCY", min(4, max(2, os.cpu_count() or 1))))
+
+# Requests mostly wait on MongoDB, so each worker serves many of them as greenlets
+worker_class = "gevent"
+worker_connections = 1000
+timeout = 120
+
+# Not preloaded: MongoClient starts monitor threads, so it must not be shared across fork
+preload_app = False
@@ -1,2 +1,4 @@
 #!/bin/bash
-gunicorn analyss:app --workers 4 --bind 0.0.0.0:$PORT --timeout 120
\ No newline at end of file
+# create_index is idempotent; a MongoDB hiccup here should not keep the API down
+flask --app analyss create-indexes || echo "Index creation failed, starting without it"
+gunicorn analyss:app
\ No newline at end of file